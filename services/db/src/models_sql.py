@@ -5,36 +5,107 @@ Handles database connection, model definitions, and table creation.
 
 from __future__ import annotations
 
+import io
 import os
-from datetime import datetime
+import random
+import re
+import time
+from datetime import datetime, timezone
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Set
 
 from sqlalchemy import (
     create_engine,
     DateTime,
     Enum,
+    event,
     ForeignKey,
     Float,
-    func,
+    Index,
+    insert,
     Integer,
+    JSON,
+    select,
     String,
     text,
 )
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    mapped_column,
+    raiseload,
+    relationship,
+    selectinload,
+    sessionmaker,
+)
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy import inspect
 
+# pgcopy is optional: binary COPY when available, COPY text format otherwise
+try:
+    from pgcopy import CopyManager
+    _PGCOPY_AVAILABLE = True
+except ImportError:
+    _PGCOPY_AVAILABLE = False
+
 
 # ============================================================================
 # SECTION 1: DATABASE CONFIGURATION
 # ============================================================================
 
-# Default SQLite path (used only when DATABASE_URL is not provided)
-DEFAULT_DB_DIR = Path(__file__).resolve().parent
-DEFAULT_DB_PATH = DEFAULT_DB_DIR / "database.db"
+# Closed set of match states; stored as VARCHAR + CHECK rather than a native enum type
+MATCH_STATUSES = ("positivo", "en progreso", "negativo")
+
+# Rows fetched per round trip when streaming the SQLite migration source
+MIGRATION_BATCH_SIZE = 10_000
+
+# Default PostgreSQL statement_timeout for pooled connections (milliseconds)
+STATEMENT_TIMEOUT_MS = 30_000
+
+# Startup connection probe: attempts, per-attempt connect timeout (s) and backoff cap (s)
+CONNECT_ATTEMPTS = 8
+CONNECT_TIMEOUT_S = 3
+CONNECT_BACKOFF_MAX_S = 30
+
+# Per-connection SQLite settings: FK enforcement plus WAL journaling tuned for bulk writes
+SQLITE_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+)
+
+# Read-side settings for the one-shot migration source: map the file and keep pages cached
+SQLITE_SOURCE_PRAGMAS = (
+    "PRAGMA mmap_size = 1073741824",
+    "PRAGMA cache_size = -262144",
+)
+
+
+# Title tokenization stored in items.title_tokens; must match the orquestador's
+# _TOKEN_RE + casefold() so Jaccard/cosine can use the stored tokens as-is
+TITLE_TOKEN_RE = re.compile(r"\w+")
+
+
+def title_tokens(title: str) -> List[str]:
+    """Casefolded word tokens of a title, in order (stopwords included)."""
+    return TITLE_TOKEN_RE.findall(title.casefold())
+
+
+@lru_cache(maxsize=None)
+def _default_db_path() -> Path:
+    """Default SQLite path (used only when DATABASE_URL is not provided); resolved on first use."""
+    return Path(__file__).resolve().parent / "database.db"
+
+
+def utcnow() -> datetime:
+    """Client-side timestamp default: values are bound like any other column, no server now() call."""
+    return datetime.now(timezone.utc)
 
-# Build DB URL from env or fallback to local SQLite
-DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DEFAULT_DB_PATH}")
 
 # Global engine and session factory
 engine = None
@@ -57,52 +128,91 @@ class Base(DeclarativeBase):
 class Item(Base):
     """Table for storing marketplace items."""
     __tablename__ = "items"
+    __table_args__ = (
+        # Unique index rather than a column constraint so ensure_indexes also builds it on
+        # databases whose items table predates it; named like PostgreSQL's default constraint
+        # name, so tables created with that constraint already satisfy IF NOT EXISTS
+        Index("items_id_item_key", "id_item", unique=True),
+    )
 
-    # Auto-incremented primary key
+    # Surrogate identifier, part of the composite primary key (id, id_item)
     id: Mapped[str] = mapped_column(String, primary_key=True)
     
-    # Foreign key: item identifier string
-    id_item: Mapped[str] = mapped_column(String, primary_key=True)
-    # Item title with unique constraint
-    title: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    # Marketplace item identifier; unique so matches can reference it directly
+    # and the API can insert with ON CONFLICT (id_item)
+    id_item: Mapped[str] = mapped_column(String, primary_key=True, nullable=False)
+    # Item title (titles may repeat across items)
+    title: Mapped[str] = mapped_column(String, nullable=False)
+    # Pre-tokenized title (see title_tokens); NULL until backfilled, readers fall back to title
+    title_tokens: Mapped[Optional[List[str]]] = mapped_column(
+        ARRAY(String).with_variant(JSON(), "sqlite"), nullable=True
+    )
     # Record creation timestamp with timezone
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=func.now(), nullable=False
+        DateTime(timezone=True), default=utcnow, nullable=False
     )
     # Record last update timestamp with automatic update
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False
+    )
+
+    # Matches referencing this item; lazy="raise" forbids implicit N+1 loads
+    matches_as_item_1: Mapped[List["Match"]] = relationship(
+        back_populates="item_1", foreign_keys="Match.id_item_1", lazy="raise"
+    )
+    matches_as_item_2: Mapped[List["Match"]] = relationship(
+        back_populates="item_2", foreign_keys="Match.id_item_2", lazy="raise"
     )
 
 
 class Match(Base):
     """Table for storing similarity matches between items."""
     __tablename__ = "matches"
+    __table_args__ = (
+        # One row per unordered pair, stored as (lower id, higher id) in code-point order:
+        # a single-probe lookup and the ON CONFLICT target for the API's upsert
+        Index("uq_matches_pair", "id_item_1", "id_item_2", unique=True),
+        # Partial index: most rows end up 'positivo', so only the rest is indexed
+        Index(
+            "ix_matches_status",
+            "status",
+            postgresql_where=text("status <> 'positivo'"),
+            sqlite_where=text("status <> 'positivo'"),
+        ),
+    )
 
     # Auto-incremented primary key
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    # Foreign key to first item
-    id_item_1: Mapped[str] = mapped_column(ForeignKey("items.id"), nullable=False)
+    # Foreign key to first item (marketplace id)
+    id_item_1: Mapped[str] = mapped_column(ForeignKey("items.id_item"), nullable=False)
     # Cached title of first item for performance
     title_item_1: Mapped[str] = mapped_column(String, nullable=False)
-    # Foreign key to second item
-    id_item_2: Mapped[str] = mapped_column(ForeignKey("items.id"), nullable=False)
+    # Foreign key to second item (marketplace id)
+    id_item_2: Mapped[str] = mapped_column(ForeignKey("items.id_item"), nullable=False)
     # Cached title of second item for performance
     title_item_2: Mapped[str] = mapped_column(String, nullable=False)
     # Similarity score between 0 and 1
     score: Mapped[float] = mapped_column(Float, nullable=False)
     # Match status: positive, in progress, or negative
-    status: Mapped[Enum] = mapped_column(
-        Enum("positivo", "en progreso", "negativo", name="match_status_enum"), 
+    status: Mapped[str] = mapped_column(
+        Enum(*MATCH_STATUSES, name="ck_match_status", native_enum=False, create_constraint=True),
         nullable=False
     )
     # Record creation timestamp
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=func.now(), nullable=False
+        DateTime(timezone=True), default=utcnow, nullable=False
     )
     # Record last update timestamp
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False
+    )
+
+    # Compared items; load explicitly (see select_matches_with_items), never lazily
+    item_1: Mapped[Item] = relationship(
+        back_populates="matches_as_item_1", foreign_keys=[id_item_1], lazy="raise"
+    )
+    item_2: Mapped[Item] = relationship(
+        back_populates="matches_as_item_2", foreign_keys=[id_item_2], lazy="raise"
     )
 
 
@@ -116,110 +226,383 @@ class MatchBackup(Base):
     id_item_2: Mapped[str] = mapped_column(String, nullable=False)
     title_item_2: Mapped[str] = mapped_column(String, nullable=False)
     score: Mapped[float] = mapped_column(Float, nullable=False)
-    status: Mapped[Enum] = mapped_column(
-        Enum("positivo", "en progreso", "negativo", name="match_backup_status_enum"), 
+    status: Mapped[str] = mapped_column(
+        Enum(*MATCH_STATUSES, name="ck_match_backup_status", native_enum=False, create_constraint=True),
         nullable=False
     )
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=func.now(), nullable=False
+        DateTime(timezone=True), default=utcnow, nullable=False
     )
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False
+        DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=False
     )
     restored_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
+def select_matches_with_items():
+    """
+    Base query for ORM reads of matches together with their items.
+    Each relationship is fetched with one extra `WHERE ... IN (...)` query
+    (selectinload) and any other attribute access raises instead of lazy loading.
+    """
+    return select(Match).options(
+        selectinload(Match.item_1),
+        selectinload(Match.item_2),
+        raiseload("*"),
+    )
+
+
 # ============================================================================
 # SECTION 4: DATABASE INITIALIZATION
 # ============================================================================
 
+def _apply_sqlite_pragmas(dbapi_connection, _connection_record, pragmas=SQLITE_PRAGMAS):
+    """Run `pragmas` on every new DBAPI connection (engine 'connect' event)."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in pragmas:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+# Escapes required by COPY's text format; None is sent as the \N null marker
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+# Escapes inside a double-quoted element of a PostgreSQL array literal
+_ARRAY_ELEMENT_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"'})
+
+
+def _copy_value(value) -> str:
+    """One column in COPY text format; lists (e.g. items.title_tokens) become array literals."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, tuple)):
+        value = "{" + ",".join(
+            "NULL" if element is None else '"' + str(element).translate(_ARRAY_ELEMENT_ESCAPES) + '"'
+            for element in value
+        ) + "}"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class _CopyRowStream(io.TextIOBase):
+    """Lazy file-like adapter that renders an iterable of rows in COPY text format."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._pending = ""
+        self.rowcount = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        lines = []
+        pending_len = len(self._pending)
+        while size < 0 or pending_len < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = "\t".join(_copy_value(value) for value in row) + "\n"
+            lines.append(line)
+            pending_len += len(line)
+            self.rowcount += 1
+        self._pending += "".join(lines)
+
+        if size < 0:
+            chunk, self._pending = self._pending, ""
+        else:
+            chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def _copy_rows(session, table, columns, rows) -> int:
+    """Stream rows into `columns` of `table` with a single PostgreSQL COPY statement (psycopg2)."""
+    raw_conn = session.connection().connection
+    if _PGCOPY_AVAILABLE:
+        # COPY ... (FORMAT BINARY): values are encoded client-side, no text parsing on the server
+        copied = 0
+
+        def counted(source):
+            nonlocal copied
+            for row in source:
+                copied += 1
+                yield row
+
+        CopyManager(raw_conn, table.name, [col.name for col in columns]).copy(counted(rows))
+        return copied
+
+    col_list = ", ".join(col.name for col in columns)
+    stream = _CopyRowStream(rows)
+    with raw_conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table.name} ({col_list}) FROM STDIN", stream)
+    return stream.rowcount
+
+
 def migrate_sqlite_to_engine(target_sessionmaker, target_engine):
     """Copy data from local SQLite file into the target engine if present."""
-    source_path = Path(os.getenv("SQLITE_MIGRATION_PATH", DEFAULT_DB_PATH))
+    source_path = Path(os.getenv("SQLITE_MIGRATION_PATH") or _default_db_path())
     if not source_path.exists():
         print(f"No SQLite migration file found at {source_path}; skipping migration.")
         return
 
-    sqlite_url = f"sqlite:///{source_path}"
+    # Read-only, immutable URI: SQLite skips locking and change detection on the source file
+    sqlite_url = f"sqlite:///file:{source_path}?mode=ro&immutable=1&uri=true"
     sqlite_engine = create_engine(sqlite_url, connect_args={"check_same_thread": False}, echo=False)
+    event.listen(
+        sqlite_engine, "connect", partial(_apply_sqlite_pragmas, pragmas=SQLITE_SOURCE_PRAGMAS)
+    )
     SourceSession = sessionmaker(autocommit=False, autoflush=False, bind=sqlite_engine)
 
-    src = SourceSession()
-    dst = target_sessionmaker()
+    # COPY is only available through the psycopg2 driver; other targets use batched INSERTs
+    use_copy = target_engine.dialect.driver == "psycopg2"
+    # Files written by older versions lack newer nullable columns (e.g. items.title_tokens)
+    source_schema = get_schema_snapshot(sqlite_engine)
 
     try:
-        for Model in (Item, Match, MatchBackup):
-            target_count = dst.query(Model).count()
-            if target_count:
-                print(f"Skipping {Model.__tablename__} migration; target already has data ({target_count}).")
-                continue
+        # A single target transaction: every table plus the sequence reset commit once
+        with SourceSession() as src, target_sessionmaker.begin() as dst:
+            if target_engine.dialect.name == "postgresql":
+                # The bulk load may legitimately outlive the pool's statement_timeout
+                dst.execute(text("SET LOCAL statement_timeout = 0"))
+
+            for Model in (Item, Match, MatchBackup):
+                # Existence probe (LIMIT 1) instead of a full COUNT(*) over the target table
+                has_rows = dst.execute(select(1).select_from(Model.__table__).limit(1)).first()
+                if has_rows:
+                    print(f"Skipping {Model.__tablename__} migration; target already has data.")
+                    continue
+
+                source_columns = source_schema.get(Model.__tablename__)
+                if not source_columns:
+                    continue
+                columns = [col for col in Model.__table__.columns if col.name in source_columns]
+
+                if Model is Match and target_engine.dialect.name == "postgresql":
+                    # Source pairs may be reversed or repeated: the (empty) table's unique pair
+                    # index is rebuilt by init_db once normalize_match_pairs has run
+                    dst.execute(text("DROP INDEX IF EXISTS uq_matches_pair"))
+
+                # Stream Core rows in fixed-size batches so peak memory stays bounded
+                rows = src.execute(
+                    select(*columns).execution_options(yield_per=MIGRATION_BATCH_SIZE)
+                )
+
+                if use_copy:
+                    migrated = _copy_rows(dst, Model.__table__, columns, rows)
+                else:
+                    # One multi-row INSERT per batch (insertmanyvalues) instead of a merge per row
+                    migrated = 0
+                    insert_stmt = insert(Model.__table__)
+                    # Column names resolved once per table, not once per row
+                    col_names = list(rows.keys())
+                    for batch in rows.partitions():
+                        dst.execute(insert_stmt, [dict(zip(col_names, row)) for row in batch])
+                        migrated += len(batch)
+                if migrated:
+                    print(f"Migrated {migrated} rows into {Model.__tablename__}.")
+
+            # Reset PostgreSQL sequences to prevent ID duplication
+            if not str(target_engine.url).startswith("sqlite"):
+                dst.execute(text("SELECT setval('matches_id_seq', (SELECT MAX(id) FROM matches));"))
+                dst.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('matches_backup', 'id'), "
+                    "(SELECT MAX(id) FROM matches_backup));"
+                ))
+        print("✓ Migration committed (data and sequences).")
+    finally:
+        sqlite_engine.dispose()
+
 
-            rows = src.query(Model).all()
-            if not rows:
+def get_schema_snapshot(target_engine) -> Dict[str, Set[str]]:
+    """
+    Map every existing table to its column names.
+    Uses a single multi-table reflection query so callers share one
+    catalog round trip instead of issuing get_table_names()/get_columns() each.
+    """
+    columns = inspect(target_engine).get_multi_columns()
+    return {table: {col["name"] for col in cols} for (_schema, table), cols in columns.items()}
+
+
+# Brings rows written before pair normalization in line with uq_matches_pair (idempotent):
+# swaps pairs into (lower, higher) code-point order, moves all but the latest row of each pair
+# into matches_backup, and drops the old non-unique pair index.
+MATCH_PAIRS_NORMALIZE_SQL = """
+UPDATE matches
+SET id_item_1 = id_item_2, title_item_1 = title_item_2,
+    id_item_2 = id_item_1, title_item_2 = title_item_1
+WHERE id_item_1 COLLATE "C" > id_item_2 COLLATE "C";
+
+WITH superseded AS (
+    DELETE FROM matches AS m
+    USING matches AS newer
+    WHERE m.id_item_1 = newer.id_item_1
+      AND m.id_item_2 = newer.id_item_2
+      AND (m.updated_at, m.id) < (newer.updated_at, newer.id)
+    RETURNING m.*
+)
+INSERT INTO matches_backup
+    (id_item_1, title_item_1, id_item_2, title_item_2, score, status, created_at, updated_at)
+SELECT DISTINCT ON (id)
+    id_item_1, title_item_1, id_item_2, title_item_2, score, status, created_at, updated_at
+FROM superseded;
+
+DROP INDEX IF EXISTS ix_matches_pair;
+"""
+
+
+# Converts status columns created as native enums (match_status_enum,
+# match_backup_status_enum) to the VARCHAR + CHECK the models declare (idempotent).
+# The partial status index is dropped first: its predicate is bound to the enum type,
+# and ensure_indexes rebuilds it over the VARCHAR column.
+_STATUS_CHECK = "status IN ({})".format(", ".join(f"'{status}'" for status in MATCH_STATUSES))
+MATCH_STATUS_VARCHAR_SQL = f"""
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'matches'
+          AND column_name = 'status' AND data_type = 'USER-DEFINED'
+    ) THEN
+        DROP INDEX IF EXISTS ix_matches_status;
+        ALTER TABLE matches ALTER COLUMN status TYPE VARCHAR(11) USING status::text;
+        ALTER TABLE matches ADD CONSTRAINT ck_match_status CHECK ({_STATUS_CHECK});
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'matches_backup'
+          AND column_name = 'status' AND data_type = 'USER-DEFINED'
+    ) THEN
+        ALTER TABLE matches_backup ALTER COLUMN status TYPE VARCHAR(11) USING status::text;
+        ALTER TABLE matches_backup ADD CONSTRAINT ck_match_backup_status CHECK ({_STATUS_CHECK});
+    END IF;
+END $$;
+DROP TYPE IF EXISTS match_status_enum;
+DROP TYPE IF EXISTS match_backup_status_enum;
+"""
+
+
+def ensure_status_varchar(target_engine):
+    """Migrate native-enum status columns of existing tables to VARCHAR + CHECK (PostgreSQL)."""
+    with target_engine.begin() as conn:
+        conn.execute(text(MATCH_STATUS_VARCHAR_SQL))
+
+
+def ensure_columns(target_engine, schema):
+    """
+    Add nullable model columns missing on tables that already existed.
+    create_all never alters existing tables; NOT NULL additions still need a manual migration.
+    """
+    quote = target_engine.dialect.identifier_preparer.quote
+    with target_engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = schema.get(table.name)
+            if existing is None:
                 continue
+            for col in table.columns:
+                if col.name in existing or not col.nullable:
+                    continue
+                col_type = col.type.compile(dialect=target_engine.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(col.name)} {col_type}"))
+                print(f"Added column {table.name}.{col.name}.")
+
+
+# Fills items.title_tokens for rows written without it (migrated or older API inserts).
+# Tokens travel as one space-joined string per item: \w+ tokens never contain spaces.
+# Keyed on id_item: legacy rows can share items.id (the old MAX(id)+1 inserts).
+ITEM_TOKENS_BACKFILL_SQL = """
+UPDATE items
+SET title_tokens = string_to_array(v.tokens, ' ')
+FROM unnest(CAST(:ids AS text[]), CAST(:tokens AS text[])) AS v(id_item, tokens)
+WHERE items.id_item = v.id_item
+"""
 
-            for row in rows:
-                data = {col.name: getattr(row, col.name) for col in Model.__table__.columns}
-                dst.merge(Model(**data))
-            dst.commit()
-            print(f"Migrated {len(rows)} rows into {Model.__tablename__}.")
-        
-        # Reset PostgreSQL sequences to prevent ID duplication
-        if not str(target_engine.url).startswith("sqlite"):
-            with target_engine.connect() as conn:
-                conn.execute(text("SELECT setval('matches_id_seq', (SELECT MAX(id) FROM matches));"))
-                conn.commit()
-                print("✓ PostgreSQL sequence reset successfully.")
-    finally:
-        dst.close()
-        src.close()
-        sqlite_engine.dispose()
 
+def backfill_title_tokens(target_engine):
+    """Tokenize titles of items with NULL title_tokens, in batches (PostgreSQL)."""
+    pending = select(Item.id_item, Item.title).where(Item.title_tokens.is_(None))
+    filled = 0
+    with target_engine.begin() as conn:
+        rows = conn.execute(pending.execution_options(yield_per=MIGRATION_BATCH_SIZE))
+        for batch in rows.partitions():
+            conn.execute(
+                text(ITEM_TOKENS_BACKFILL_SQL),
+                {
+                    "ids": [row.id_item for row in batch],
+                    "tokens": [" ".join(title_tokens(row.title)) for row in batch],
+                },
+            )
+            filled += len(batch)
+    if filled:
+        print(f"Tokenized {filled} item titles.")
+
+
+def normalize_match_pairs(target_engine):
+    """Normalize legacy match pairs so the unique pair index can be built (PostgreSQL)."""
+    with target_engine.begin() as conn:
+        conn.execute(text(MATCH_PAIRS_NORMALIZE_SQL))
+
+
+# Legacy items tables carry no unique index on id_item; list repeated ids before
+# building it (skipped once the index exists)
+DUPLICATE_ITEM_IDS_SQL = """
+SELECT id_item FROM items
+WHERE to_regclass('items_id_item_key') IS NULL
+GROUP BY id_item
+HAVING COUNT(*) > 1
+ORDER BY id_item
+LIMIT 10
+"""
 
-def ensure_postgres_schema(target_engine):
-    """Fuerza la eliminación de la restricción de unicidad en ID y configura PK compuesta."""
-    inspector = inspect(target_engine)
-    if "items" not in inspector.get_table_names():
-        return
 
-    print("Verificando integridad de la tabla 'items' en Postgres...")
-    
+def check_unique_item_ids(target_engine):
+    """Fail before ensure_indexes if legacy items repeat an id_item (PostgreSQL)."""
     with target_engine.connect() as conn:
-        # 1. Asegurar que id_item existe
-        cols = {c["name"] for c in inspector.get_columns("items")}
-        if "id_item" not in cols:
-            conn.execute(text("ALTER TABLE items ADD COLUMN id_item VARCHAR"))
-            conn.commit()
-
-        # 2. Rellenar id_item si está vacío
-        conn.execute(text("UPDATE items SET id_item = id WHERE id_item IS NULL"))
-        
-        # 3. ELIMINAR CUALQUIER RESTRICCIÓN O ÍNDICE QUE BLOQUEE EL ID
-        # Ejecutamos comandos SQL puros para limpiar el rastro de 'items_id_key'
-        commands = [
-            "ALTER TABLE matches DROP CONSTRAINT IF EXISTS matches_id_item_1_fkey",
-            "ALTER TABLE matches DROP CONSTRAINT IF EXISTS matches_id_item_2_fkey",
-            "ALTER TABLE items DROP CONSTRAINT IF EXISTS items_id_key CASCADE",
-            "DROP INDEX IF EXISTS items_id_key",
-            "ALTER TABLE items DROP CONSTRAINT IF EXISTS items_pkey CASCADE",
-            "ALTER TABLE items DROP CONSTRAINT IF EXISTS items_title_key CASCADE" # Por si los títulos se repiten
-        ]
-        
-        for cmd in commands:
-            try:
-                conn.execute(text(cmd))
-                conn.commit()
-            except Exception as e:
-                print(f"Nota: No se pudo ejecutar '{cmd}' (probablemente ya no existe).")
-
-        # 4. APLICAR LA NUEVA LLAVE PRIMARIA COMPUESTA
-        print("Aplicando nueva Primary Key compuesta (id, id_item)...")
-        try:
-            conn.execute(text("ALTER TABLE items ADD PRIMARY KEY (id, id_item)"))
-            conn.commit()
-            print("✓ Configuración de base de datos exitosa.")
-        except Exception as e:
-            print(f"Error al crear la PK: {e}")
+        duplicates = conn.execute(text(DUPLICATE_ITEM_IDS_SQL)).scalars().all()
+    if duplicates:
+        raise RuntimeError(
+            "items has repeated id_item values, so the unique index items_id_item_key "
+            f"cannot be built; resolve them first (e.g. {', '.join(duplicates)})"
+        )
+
+
+def ensure_indexes(target_engine, tables):
+    """
+    Create any model index missing on existing tables.
+    create_all only emits indexes together with new tables, so existing
+    deployments (and indexes dropped for the migration) get them here
+    with idempotent CREATE INDEX IF NOT EXISTS.
+    """
+    with target_engine.begin() as conn:
+        for table in tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# Server-side id generation for the API inserts (idempotent, one round trip):
+# items.id (VARCHAR) draws from items_id_seq; all three sequences are moved past existing ids
+# so rows written earlier with MAX(id)+1 (or copied with explicit ids) cannot collide
+# with the next nextval().
+POSTGRES_ID_DEFAULTS_SQL = """
+CREATE SEQUENCE IF NOT EXISTS items_id_seq OWNED BY items.id;
+ALTER TABLE items ALTER COLUMN id SET DEFAULT nextval('items_id_seq')::text;
+SELECT setval('items_id_seq', COALESCE(max_id, 1), max_id IS NOT NULL)
+FROM (SELECT MAX(CASE WHEN id ~ '^[0-9]+$' THEN id::bigint END) AS max_id FROM items) AS s;
+SELECT setval(pg_get_serial_sequence('matches', 'id'), COALESCE(max_id, 1), max_id IS NOT NULL)
+FROM (SELECT MAX(id) AS max_id FROM matches) AS s;
+SELECT setval(pg_get_serial_sequence('matches_backup', 'id'), COALESCE(max_id, 1), max_id IS NOT NULL)
+FROM (SELECT MAX(id) AS max_id FROM matches_backup) AS s;
+"""
+
+
+def ensure_id_defaults(target_engine):
+    """
+    Give items/matches ids a server-side default the API can rely on instead of MAX(id)+1,
+    and move the matches_backup sequence past migrated backup ids.
+    """
+    with target_engine.begin() as conn:
+        conn.execute(text(POSTGRES_ID_DEFAULTS_SQL))
+
 
 def init_db(database_url: Optional[str] = None):
     """
@@ -229,7 +612,8 @@ def init_db(database_url: Optional[str] = None):
     """
     global engine, SessionLocal
 
-    url = database_url or DATABASE_URL
+    # Environment is read at call time, so overrides apply without re-importing the module
+    url = database_url or os.getenv("DATABASE_URL") or f"sqlite:///{_default_db_path()}"
     is_sqlite = url.startswith("sqlite:///")
 
     # For SQLite, ensure directory exists and detect prior file
@@ -243,32 +627,72 @@ def init_db(database_url: Optional[str] = None):
         db_exists = None
         print(f"Database URL: {url}")
 
-    engine_kwargs = {"echo": False}
+    engine_kwargs = {"echo": False, "insertmanyvalues_page_size": MIGRATION_BATCH_SIZE}
     if is_sqlite:
+        # A single shared connection: SQLite serializes writers anyway
         engine_kwargs["connect_args"] = {"check_same_thread": False}
-
-    try:
-        engine = create_engine(url, **engine_kwargs)
-        with engine.connect() as conn:
-            if is_sqlite:
-                conn.execute("PRAGMA foreign_keys = ON")
+        engine_kwargs["poolclass"] = StaticPool
+    else:
+        engine_kwargs.update(
+            pool_size=10,
+            max_overflow=20,
+            pool_timeout=30,
+            pool_recycle=1800,
+            pool_pre_ping=True,
+            connect_args={
+                # Server-side guard so a runaway query cannot hold a pooled connection forever
+                "options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}",
+                # Fail fast on an unreachable host instead of waiting for the TCP timeout
+                "connect_timeout": CONNECT_TIMEOUT_S,
+            },
+        )
+
+    # The engine is built once; only the connection probe is retried while the
+    # database warms up, with exponential backoff plus jitter
+    engine = create_engine(url, **engine_kwargs)
+    if is_sqlite:
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    for attempt in range(CONNECT_ATTEMPTS):
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
             print("✓ Database connection successful.")
-    except Exception as e:
-        print(f"✗ Error connecting to database: {e}")
-        exit(1)
-
-    # Always ensure tables are present (safe if they already exist)
+            break
+        except Exception as e:
+            if attempt == CONNECT_ATTEMPTS - 1:
+                print(f"✗ Error connecting to database: {e}")
+                exit(1)
+            delay = min(CONNECT_BACKOFF_MAX_S, 0.5 * 2**attempt + random.random())
+            print(f"Database not ready (attempt {attempt + 1}/{CONNECT_ATTEMPTS}); retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    # Always ensure tables are present; one reflection snapshot replaces
+    # create_all's per-table existence checks and drives the index sync
     print("Ensuring database tables exist...")
-    Base.metadata.create_all(engine)
-    print("✓ Database tables ready.")
+    schema = get_schema_snapshot(engine)
+    missing = [table for table in Base.metadata.sorted_tables if table.name not in schema]
+    if missing:
+        Base.metadata.create_all(engine, tables=missing)
+    ensure_columns(engine, schema)
+    if not is_sqlite:
+        ensure_status_varchar(engine)
 
     # Create session factory
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     # If we're targeting Postgres (or any non-SQLite URL), migrate data from local SQLite if available
     if not is_sqlite:
-        ensure_postgres_schema(engine)
         migrate_sqlite_to_engine(SessionLocal, engine)
+        ensure_id_defaults(engine)
+        # After the migration (copied pairs included) and after the sequence reset
+        # (superseded rows are moved into matches_backup with fresh ids)
+        normalize_match_pairs(engine)
+        check_unique_item_ids(engine)
+    ensure_indexes(engine, Base.metadata.sorted_tables)
+    print("✓ Database tables ready.")
+
+    if not is_sqlite:
+        backfill_title_tokens(engine)
 
     print("✓ Database initialization completed.")
     return engine, SessionLocal
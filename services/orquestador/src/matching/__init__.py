@@ -0,0 +1,5 @@
+"""
+Kernels numéricos para los algoritmos de similitud del orquestador.
+Cada kernel es opcional: si su dependencia (numba) no está instalada,
+SimilarityService conserva la implementación en Python puro.
+"""
@@ -0,0 +1,96 @@
+"""
+Razón de Ratcliff–Obershelp (difflib.SequenceMatcher.ratio) compilada con Numba.
+
+Reproduce exactamente SequenceMatcher(None, a, b).ratio() sobre los code points de
+ambos textos: misma búsqueda del bloque común más largo (desempate por el primero en
+a y luego en b), misma recursión a izquierda y derecha, y la misma heurística
+"autojunk" (con len(b) >= 200, los caracteres de b que aparecen más de len(b)//100 + 1
+veces no inician coincidencias, aunque sí las extienden). Los diccionarios j2len de
+difflib se reemplazan por dos arrays que se reutilizan fila a fila.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+
+if _NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _find_longest_match(a, b, popular, alo, ahi, blo, bhi, j2len, newj2len):
+        """Bloque común más largo de a[alo:ahi] y b[blo:bhi] como (i, j, tamaño)."""
+        besti, bestj, bestsize = alo, blo, 0
+        for j in range(blo, bhi + 1):
+            j2len[j] = 0
+            newj2len[j] = 0
+        for i in range(alo, ahi):
+            ai = a[i]
+            for j in range(blo, bhi):
+                if b[j] == ai and not popular[j]:
+                    # j2len/newj2len desplazados en 1: la posición j + 1 corresponde a b[j]
+                    k = j2len[j] + 1
+                    newj2len[j + 1] = k
+                    if k > bestsize:
+                        besti, bestj, bestsize = i - k + 1, j - k + 1, k
+                else:
+                    newj2len[j + 1] = 0
+            j2len, newj2len = newj2len, j2len
+        # Sin junk explícito, solo los caracteres populares pueden prolongar el bloque
+        while besti > alo and bestj > blo and a[besti - 1] == b[bestj - 1]:
+            besti, bestj, bestsize = besti - 1, bestj - 1, bestsize + 1
+        while besti + bestsize < ahi and bestj + bestsize < bhi and a[besti + bestsize] == b[bestj + bestsize]:
+            bestsize += 1
+        return besti, bestj, bestsize
+
+    @njit(cache=True)
+    def _ratio_kernel(a, b):
+        """2·M/T, con M la suma de los bloques de get_matching_blocks()."""
+        la, lb = a.shape[0], b.shape[0]
+        if la + lb == 0:
+            return 1.0
+        popular = np.zeros(lb, dtype=np.bool_)
+        if lb >= 200:
+            # Conteo por carácter sobre las posiciones ordenadas por valor: cada corrida
+            # de iguales más larga que ntest marca sus posiciones como populares
+            ntest = lb // 100 + 1
+            order = np.argsort(b, kind="mergesort")
+            start = 0
+            for end in range(1, lb + 1):
+                if end == lb or b[order[end]] != b[order[start]]:
+                    if end - start > ntest:
+                        for r in range(start, end):
+                            popular[order[r]] = True
+                    start = end
+        j2len = np.zeros(lb + 1, dtype=np.int64)
+        newj2len = np.zeros(lb + 1, dtype=np.int64)
+        # Pila explícita en lugar de la cola de difflib: el conjunto de bloques es el mismo
+        stack = [(0, la, 0, lb)]
+        matches = 0
+        while len(stack) > 0:
+            alo, ahi, blo, bhi = stack.pop()
+            i, j, k = _find_longest_match(a, b, popular, alo, ahi, blo, bhi, j2len, newj2len)
+            if k:
+                matches += k
+                if alo < i and blo < j:
+                    stack.append((alo, i, blo, j))
+                if i + k < ahi and j + k < bhi:
+                    stack.append((i + k, ahi, j + k, bhi))
+        return 2.0 * matches / (la + lb)
+
+    # Compilación (o carga desde la caché en disco) al importar, no en la primera solicitud
+    _ratio_kernel(np.zeros(1, dtype=np.uint32), np.zeros(1, dtype=np.uint32))
+
+
+def _code_points(text):
+    """Code points del texto como uint32 (misma unidad que compara difflib sobre str)."""
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def sequence_ratio(text1, text2):
+    """
+    Igual a difflib.SequenceMatcher(None, text1, text2).ratio(). Requiere _NUMBA_AVAILABLE.
+    """
+    return _ratio_kernel(_code_points(text1), _code_points(text2))